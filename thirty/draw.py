@@ -27,8 +27,120 @@ SOFTWARE.
 """
 
 from panda3d.core import NodePath
+from panda3d.core import Point3
 from panda3d.core import Vec3
 
+import numpy as np
+
+from . import tools
+
+
+class DrawContext(object):
+    """
+    Immutable, float32 transform of a Draw rig, i.e. the state `points` and
+    `vectors` depend on. Shapes that hold their own context instead of
+    mutating a shared Draw can be built concurrently.
+
+    Arguments:
+        matrix: array like of shape (4, 4) with the rows up, right, forward
+            and origin
+    """
+    __slots__ = ('_matrix', )
+
+    def __init__(self, matrix):
+        self._matrix = np.array(matrix, np.float32)
+        self._matrix.flags.writeable = False
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @property
+    def basis(self):
+        return self._matrix[:3, :3]
+
+    @property
+    def origin(self):
+        return self._matrix[3, :3]
+
+    def points(self, h, p, d, x=0, y=0, z=0):
+        """
+        Return the world positions of draw for many rig settings at once,
+        without touching the scene graph. All arguments broadcast against each
+        other like numpy ufuncs and are cast to float32 once on entry.
+
+        Arguments:
+            h: heading(s) of the rig
+            p: pitch(es) of the rig
+            d: distance(s)/radius of draw
+            x: x-axis offset(s) as viewed from the base
+            y: y-axis offset(s) as viewed from the base
+            z: direction-axis offset(s)
+
+        Returns: float32 ndarray of shape (..., 3)
+        """
+        return self.transform(self._local(h, p, d, x, y, z))
+
+    def transform(self, local):
+        """
+        Return positions given in the frame of the origin, e.g. `points` of
+        the identity context, in world space.
+
+        Arguments:
+            local: array like of shape (..., 3)
+
+        Returns: float32 ndarray of shape (..., 3)
+        """
+        return np.asarray(local, np.float32) @ self._matrix[:3, :3] \
+            + self._matrix[3, :3]
+
+    def vectors(self, h, p, d=1):
+        """
+        Return the world space direction(s) from orientation to draw, i.e.
+        `points` without the origin translation. With the default `d` these
+        are unit vectors, e.g. usable as normals.
+
+        Arguments:
+            h: heading(s) of the rig
+            p: pitch(es) of the rig
+            d: distance(s)/radius of draw
+
+        Returns: float32 ndarray of shape (..., 3)
+        """
+        return self._local(h, p, d) @ self._matrix[:3, :3]
+
+    @staticmethod
+    def _local(h, p, d, x=0, y=0, z=0):
+        """Return draw positions in the frame of the origin."""
+        h, p, d, x, y, z = (
+            np.asarray(a, np.float32) for a in (h, p, d, x, y, z)
+        )
+        h = np.radians(h)
+        p = np.radians(p)
+        r = np.cos(p) * d
+        return np.stack(np.broadcast_arrays(
+            x - np.sin(h) * r,
+            np.cos(h) * r - y,
+            z + np.sin(p) * d
+        ), axis=-1)
+
+
+def make_context(origin, direction):
+    """
+    Return the DrawContext of a rig at `origin`, looking towards `direction`.
+    The transform is stored as float32, the precision of the vertex data it
+    ends up in.
+
+    Arguments:
+        origin: Vec3
+        direction: Vec3
+    """
+    right, forward, up = tools.look_at(direction)
+    matrix = np.identity(4, np.float32)
+    matrix[:3, :3] = up, right, forward
+    matrix[3, :3] = tuple(origin)
+    return DrawContext(matrix)
+
 
 class Draw(object):
     # noinspection PyArgumentList
@@ -41,6 +153,7 @@ class Draw(object):
         self._draw = self._orientation.attach_new_node('draw')
         self._origin_p.set_p(-90)
         self._origin_h.set_h(-90)
+        self._context = DrawContext(np.identity(4))
 
     def reset(self):
         self._origin.set_pos(0, 0, 0)
@@ -49,10 +162,22 @@ class Draw(object):
         self._draw.set_pos_hpr(Vec3(0), Vec3(0))
 
     def setup(self, origin, direction):
+        self.set_frame(origin, direction)
         self.reset()
         self._origin.look_at(direction)
         self._origin.set_pos(origin)
 
+    def set_frame(self, origin, direction):
+        """
+        Update only the transform used by `points` and `vectors`, without
+        touching the scene graph.
+
+        Arguments:
+            origin: Vec3
+            direction: Vec3
+        """
+        self._context = make_context(origin, direction)
+
     def set_pos_hp_d(self, x, y, z, h, p, d):
         """
         Update rig position, orientation and distance of draw from orientation.
@@ -81,6 +206,14 @@ class Draw(object):
         if d is not None:
             self._draw.set_y(d)
 
+    def points(self, h, p, d, x=0, y=0, z=0):
+        """Like `DrawContext.points` for the current frame."""
+        return self._context.points(h, p, d, x, y, z)
+
+    def vectors(self, h, p, d=1):
+        """Like `DrawContext.vectors` for the current frame."""
+        return self._context.vectors(h, p, d)
+
     def set_f(self, f):
         self._orientation.set_z(f)
 
@@ -101,13 +234,13 @@ class Draw(object):
 
     @property
     def center_pos(self):
-        pos = self._orientation.get_pos()
-        hpr = self._orientation.get_hpr()
-        z = self._draw.get_pos(self._origin).y
-        self._orientation.set_pos_hpr(0, 0, z, 0, 0, 0)
-        c_pos = self._orientation.get_pos(self._world)
-        self._orientation.set_pos_hpr(pos, hpr)
-        return c_pos
+        """
+        Position of draw projected onto the direction axis, computed from the
+        cached frame instead of temporarily moving the rig.
+        """
+        forward, origin = self._context.basis[2], self._context.origin
+        f = np.dot(np.subtract(self.pos, origin), forward)
+        return Point3(*(origin + forward * f))
 
     @property
     def origin_pos(self):
@@ -26,6 +26,8 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from functools import lru_cache
+
 from panda3d.core import Vec3
 from panda3d.core import Vec4
 
@@ -34,18 +36,199 @@ import numpy as np
 from . import draw
 from . import tools
 from . import mesh
+from . import mesh_opt
 
 NAC = True
-D = draw.Draw()
+
+_CUBOID_CORNERS = np.array([
+    (-1, -1, -1),   # dfl
+    (1, -1, -1),    # dfr
+    (1, 1, -1),     # dbr
+    (-1, 1, -1),    # dbl
+    (-1, -1, 1),    # ufl
+    (1, -1, 1),     # ufr
+    (1, 1, 1),      # ubr
+    (-1, 1, 1),     # ubl
+], dtype=np.float32)
+_CUBOID_FACES = np.array([
+    (4, 5, 6, 7),   # Up
+    (0, 3, 2, 1),   # Down
+    (1, 2, 6, 5),   # Right
+    (0, 4, 7, 3),   # Left
+    (0, 1, 5, 4),   # Front
+    (3, 7, 6, 2),   # Back
+])
+# Rig heading/pitch of the outward normal of each face in _CUBOID_FACES
+_CUBOID_NORMALS_HP = np.array([
+    (0, 90),        # Up
+    (0, -90),       # Down
+    (-90, 0),       # Right
+    (90, 0),        # Left
+    (0, 0),         # Front
+    (180, 0),       # Back
+], dtype=np.float32)
+_CUBOID_INDICES = np.array([2, 1, 0, 0, 3, 2]) + 4 * np.arange(6)[:, None]
+
+
+def _ring_triangles(verts, wrap_around=True):
+    """
+    Return ndarray of shape (M, 3) with the vertex ids of the triangles that
+    connect each line of `verts` to the next one.
+
+    Args:
+        verts: list of vertex id lines, e.g. rings and single points
+        wrap_around: whether the lines are closed rings
+    """
+    triangles = [np.empty((0, 3), int)]
+    start = 0
+    for end in range(1, len(verts) + 1):
+        if end < len(verts) and len(verts[end]) == len(verts[start]):
+            continue
+        if end - start > 1:
+            # Runs of equal lines, e.g. the rings of a body, share one table
+            lines = np.asarray(verts[start:end])
+            table = tools.connect_lines_array(
+                lines.shape[1],
+                lines.shape[1],
+                wrap_around
+            )
+            pairs = np.concatenate((lines[1:], lines[:-1]), axis=1)
+            triangles.append(pairs[:, table].reshape(-1, 3))
+        if end < len(verts):
+            lower, upper = verts[end - 1], verts[end]
+            table = tools.connect_lines_array(
+                len(upper),
+                len(lower),
+                wrap_around
+            )
+            triangles.append(np.take(np.concatenate((upper, lower)), table))
+        start = end
+    return np.concatenate(triangles)
 
 
 def _populate_triangles(m, verts, wrap_around=True):
-    for i in range(len(verts) - 1):
-        upper = verts[i + 1]
-        lower = verts[i]
-        for u, l in tools.connect_lines(len(upper), len(lower), wrap_around):
-            triangle = [upper[v] for v in u] + [lower[v] for v in l]
-            m.add_triangle(*triangle)
+    m.add_triangles(_ring_triangles(verts, wrap_around))
+
+
+def _add_lines(m, lines, color):
+    """
+    Return the vertex ids of `lines` as list of arrays, after adding all their
+    points to the mesh in one call.
+
+    Args:
+        m: mesh.Mesh
+        lines: list of ndarray of shape (N, 3), e.g. rings and single points
+        color: Vec4
+    """
+    ids = np.asarray(m.add_vertices(np.concatenate(lines), color))
+    return np.split(ids, np.cumsum([len(line) for line in lines[:-1]]))
+
+
+def _flat_node(name, points, normals, indices, color, normal_as_color):
+    """
+    Return GeomNode of flat shaded, indexed triangles, written straight into a
+    VertexArray without going through a Mesh.
+
+    Args:
+        name: name of the node
+        points: ndarray of shape (N, 3)
+        normals: ndarray of shape (N, 3) with the face normal of each row
+        indices: array like of row ids, three per triangle
+        color: Vec4
+        normal_as_color: whether to use the face normal as color
+    """
+    va = mesh.VertexArray(name)
+    _add_flat(va, points, normals, indices, color, normal_as_color)
+    return va.get_node()
+
+
+def _add_flat(va, points, normals, indices, color, normal_as_color):
+    """
+    Append flat shaded, indexed triangles to a VertexArray. Arguments as in
+    _flat_node(...), with `indices` relative to the appended rows.
+    """
+    colors = normals if normal_as_color else tuple(color)
+    offset = va.add_rows(points, normals, colors, (0, 0))
+    va.add_triangles(np.asarray(indices) + offset)
+
+
+@lru_cache(maxsize=64)
+def _prism_topology(polygon, segments):
+    """
+    Return the shape independent part of a prism as 5-Tuple of read-only
+    arrays, shared by all prisms with the same `polygon` and `segments`:
+    the ring headings (P, ), the side normal headings (P, ), the point id
+    of each row into caps + rings (N, ), the normal id of each row into
+    base, top and side normals (N, ) and the triangle indices (M, 3).
+    """
+    h_steps = np.linspace(0, 360, polygon, endpoint=False, dtype=np.float32)
+    # Side normals point outwards through the middle of each column's edge
+    n_steps = h_steps + np.float32(180 / polygon)
+
+    # Rows: base apex + ring, 4 per side quad, top apex + ring
+    i = np.arange(polygon)
+    j = (i + 1) % polygon
+    ring = 2 + polygon * np.arange(segments + 1)[:, None]
+    quads = np.stack(
+        (ring[:-1] + i, ring[:-1] + j, ring[1:] + j, ring[1:] + i),
+        axis=2
+    ).reshape(-1)
+    point_ids = np.concatenate(([0], ring[0] + i, quads, [1], ring[-1] + i))
+    normal_ids = np.concatenate((
+        np.zeros(polygon + 1, int),
+        np.repeat(np.tile(2 + i, segments), 4),
+        np.ones(polygon + 1, int)
+    ))
+
+    num_quads = polygon * segments
+    top = 1 + polygon + 4 * num_quads
+    q = 1 + polygon + 4 * np.arange(num_quads)
+    indices = np.concatenate((
+        np.stack((1 + j, 1 + i, np.zeros_like(i)), axis=1),
+        (q[:, None, None] + [[3, 0, 1], [2, 3, 1]]).reshape(-1, 3),
+        np.stack((np.full_like(i, top), top + 1 + i, top + 1 + j), axis=1)
+    ))
+    topology = h_steps, n_steps, point_ids, normal_ids, indices
+    for a in topology:
+        a.flags.writeable = False
+    return topology
+
+
+def _prism_rows(
+        origin,
+        direction,
+        polygon,
+        radius,
+        length,
+        center_offset,
+        segments
+):
+    """
+    Return the flat shaded rows of a prism as 3-Tuple of points (N, 3),
+    normals (N, 3) and triangle indices (M, 3). Arguments as in prism(...).
+    """
+    h_steps, n_steps, point_ids, normal_ids, indices = _prism_topology(
+        polygon,
+        segments
+    )
+    ctx = draw.make_context(origin, direction)
+    steps = np.linspace(
+        -length * center_offset,
+        length * (1.0 - center_offset),
+        segments + 1,
+        dtype=np.float32
+    )
+    # Caps first, then the rings flattened
+    points = np.concatenate((
+        ctx.points(0, 0, 0, z=steps[[0, -1]]),
+        ctx.points(h_steps, 0, radius, z=steps[:, None]).reshape(-1, 3)
+    ))
+    # Exact normals: the caps face along the axis, the sides radially
+    normals = np.concatenate((
+        ctx.vectors(0, [-90, 90]),
+        ctx.vectors(n_steps, 0)
+    ))
+    return points[point_ids], normals[normal_ids], indices
 
 
 def prism(
@@ -57,10 +240,14 @@ def prism(
         center_offset=0.5,
         segments=1,
         color=Vec4(1),
-        normal_as_color=NAC
+        normal_as_color=NAC,
+        out=None,
+        optimize_cache=False
 ):
     """
-    Return GeomNode of prism.
+    Return GeomNode of prism. If `out` is passed, the prism is appended to that
+    mesh.VertexArray instead and `out` is returned, which allows to build many
+    prisms into a single Geom.
 
     Args:
         origin: Mesh origin
@@ -72,32 +259,173 @@ def prism(
         segments: number of segments between base and top
         color: Vec4
         normal_as_color: whether to use the normal as color
+        out: Optional mesh.VertexArray to append to
+        optimize_cache: whether to reorder the triangles for the GPU vertex
+            cache, only applied when `polygon * segments` exceeds 64.
     """
-    D.setup(origin, direction)
-    steps = np.linspace(
-        -length * center_offset,
-        length * (1.0 - center_offset),
-        segments + 1
+    points, normals, indices = _prism_rows(
+        origin,
+        direction,
+        polygon,
+        radius,
+        length,
+        center_offset,
+        segments
     )
+    if optimize_cache and polygon * segments > 64:
+        indices = mesh_opt.optimize_vertex_cache(indices)
+    rows = points, normals, indices
+    if out is None:
+        return _flat_node('prism', *rows, color, normal_as_color)
+    _add_flat(out, *rows, color, normal_as_color)
+    return out
+
+
+def prism_batch(
+        origins,
+        polygons,
+        radii,
+        lengths,
+        directions=Vec3(0, 0, 1),
+        center_offset=0.5,
+        segments=1,
+        color=Vec4(1),
+        normal_as_color=NAC
+):
+    """
+    Return a single GeomNode containing many prisms in one Geom, so they are
+    rendered with a single draw call. Per prism arguments broadcast against
+    the number of origins.
 
-    m = mesh.Mesh('prism')
-    D.set_f(steps[0])
-    D.set_d(0)
-    verts = [[m.add_vertex(D.pos, color)]]
-    D.set_d(radius)
-    for z in steps:
-        D.set_f(z)
-        line = []
-        for h in np.linspace(0, 360, polygon, endpoint=False):
-            D.set_hp_d(h, 0)
-            line.append(m.add_vertex(D.pos, color))
-        verts.append(line)
-
-    D.set_d(0)
-    verts.append([m.add_vertex(D.pos, color)])
+    Args:
+        origins: array like of shape (N, 3)
+        polygons: int or array like of shape (N, ) (3+)
+        radii: float or array like of shape (N, )
+        lengths: float or array like of shape (N, )
+        directions: Vec3 or array like of shape (N, 3)
+        center_offset: Optional float 0..1, indicating where the origin lies
+        segments: number of segments between base and top
+        color: Vec4
+        normal_as_color: whether to use the normal as color
+    """
+    origins = np.asarray(origins, np.float32).reshape(-1, 3)
+    count = len(origins)
+    directions = np.broadcast_to(
+        np.asarray(directions, np.float32).reshape(-1, 3),
+        (count, 3)
+    )
+    polygons, radii, lengths = (
+        np.broadcast_to(a, (count, )) for a in (polygons, radii, lengths)
+    )
+    # Rows and triangles per prism are known from the shared topology
+    topologies = [_prism_topology(int(p), segments) for p in polygons]
+    va = mesh.VertexArray('prisms')
+    va.reserve(
+        sum(len(t[2]) for t in topologies),
+        sum(t[4].size for t in topologies)
+    )
+    for o, d, p, r, l in zip(origins, directions, polygons, radii, lengths):
+        prism(
+            o,
+            int(p),
+            r,
+            l,
+            d,
+            center_offset,
+            segments,
+            color,
+            normal_as_color,
+            out=va
+        )
+    return va.get_node()
+
+
+def compile_prism(
+        polygon,
+        segments=1,
+        color=Vec4(1),
+        normal_as_color=NAC,
+        center_offset=0.5,
+        optimize_cache=False
+):
+    """
+    Return a function `bake(origin, direction, radius, length)` that builds
+    the same GeomNode as prism(...) with the remaining arguments fixed. The
+    topology, the unit ring, the local normals and the (optionally cache
+    optimized) triangle indices are computed once here, leaving one basis
+    transform and one vertex write per call.
 
-    _populate_triangles(m, verts)
-    return m.export(normal_as_color=normal_as_color)
+    Args:
+        polygon: Number of vertices in the base polygon (3+)
+        segments: number of segments between base and top
+        color: Vec4
+        normal_as_color: whether to use the normal as color
+        center_offset: Optional float 0..1, indicating where the origin lies
+        optimize_cache: as in prism(...)
+    """
+    h_steps, n_steps, point_ids, normal_ids, indices = _prism_topology(
+        polygon,
+        segments
+    )
+    if optimize_cache and polygon * segments > 64:
+        indices = mesh_opt.optimize_vertex_cache(indices)
+    local = draw.DrawContext(np.identity(4))
+    # Unit ring and exact normals in the frame of the origin
+    ring = local.points(h_steps, 0, 1)
+    normals = np.concatenate((
+        local.vectors(0, [-90, 90]),
+        local.vectors(n_steps, 0)
+    ))[normal_ids]
+    forward = np.array((0, 0, 1), np.float32)
+
+    def bake(origin, direction, radius, length):
+        ctx = draw.make_context(origin, direction)
+        steps = np.linspace(
+            -length * center_offset,
+            length * (1.0 - center_offset),
+            segments + 1,
+            dtype=np.float32
+        )
+        points = np.concatenate((
+            steps[[0, -1], None] * forward,
+            (ring * np.float32(radius)
+             + steps[:, None, None] * forward).reshape(-1, 3)
+        ))
+        return _flat_node(
+            'prism',
+            ctx.transform(points[point_ids]),
+            normals @ ctx.basis,
+            indices,
+            color,
+            normal_as_color
+        )
+
+    return bake
+
+
+def merge_nodes(nodes, name='merged'):
+    """
+    Return a single GeomNode with the geometry of all GeomNodes in `nodes`
+    in one Geom, so they are rendered with a single draw call. Transforms and
+    render states of the inputs are not applied.
+
+    Args:
+        nodes: iterable of GeomNode
+        name: name of the resulting GeomNode
+    """
+    geoms = [geom for node in nodes for geom in node.get_geoms()]
+    va = mesh.VertexArray(name)
+    va.reserve(
+        sum(geom.get_vertex_data().get_num_rows() for geom in geoms),
+        sum(
+            prim.get_num_faces() * 3
+            for geom in geoms
+            for prim in geom.get_primitives()
+        )
+    )
+    for geom in geoms:
+        va.add_geom(geom)
+    return va.get_node()
 
 
 def cuboid(origin, bounds, direction, color=Vec4(1), normal_as_color=NAC):
@@ -111,34 +439,19 @@ def cuboid(origin, bounds, direction, color=Vec4(1), normal_as_color=NAC):
         color: Vec4
         normal_as_color: whether to use vertex normal as color
     """
-    dfl = Vec3(-bounds[0], -bounds[1], -bounds[2])
-    dfr = Vec3(bounds[0], -bounds[1], -bounds[2])
-    dbr = Vec3(bounds[0], bounds[1], -bounds[2])
-    dbl = Vec3(-bounds[0], bounds[1], -bounds[2])
-    ufl = Vec3(-bounds[0], -bounds[1], bounds[2])
-    ufr = Vec3(bounds[0], -bounds[1], bounds[2])
-    ubr = Vec3(bounds[0], bounds[1], bounds[2])
-    ubl = Vec3(-bounds[0], bounds[1], bounds[2])
-
-    faces = [
-        (ufl, ufr, ubr, ubl),   # Up
-        (dfl, dbl, dbr, dfr),   # Down
-        (dfr, dbr, ubr, ufr),   # Right
-        (dfl, ufl, ubl, dbl),   # Left
-        (dfl, dfr, ufr, ufl),   # Front
-        (dbl, ubl, ubr, dbr),   # Back
-    ]
-
-    D.setup(origin, direction)
-    m = mesh.Mesh('cuboid')
-    for f in faces:
-        pts = []
-        for p in f:
-            D.set_pos_hp_d(p.x, p.y, p.z, 0, 0, 0)
-            pts.append(m.add_vertex(D.pos, color))
-        m.add_triangle(*reversed(pts[:3]))
-        m.add_triangle(pts[0], *reversed(pts[2:]))
-    return m.export(normal_as_color=normal_as_color)
+    ctx = draw.make_context(origin, direction)
+    bounds = np.asarray(bounds, np.float32)
+    corners = ctx.points(0, 0, 0, *(_CUBOID_CORNERS * bounds).T)
+    faces = corners[_CUBOID_FACES]
+    normals = ctx.vectors(*_CUBOID_NORMALS_HP.T)
+    return _flat_node(
+        'cuboid',
+        faces.reshape(-1, 3),
+        np.repeat(normals, 4, axis=0),
+        _CUBOID_INDICES,
+        color,
+        normal_as_color
+    )
 
 
 def cone(
@@ -168,43 +481,42 @@ def cone(
         color: Vec4
         normal_as_color: whether to use the vertex normal as color
     """
-    D.setup(origin, direction)
+    ctx = draw.make_context(origin, direction)
     m = mesh.Mesh('cone')
 
-    h_steps = np.linspace(0, 360, polygon, endpoint=False)
-    r_steps = np.linspace(*radii, segments + 1)
-    x_steps = np.linspace(0, top_offset[0], segments + 1)
-    y_steps = np.linspace(0, top_offset[1], segments + 1)
+    h_steps = np.linspace(0, 360, polygon, endpoint=False, dtype=np.float32)
+    r_steps = np.linspace(*radii, segments + 1, dtype=np.float32)
+    x_steps = np.linspace(0, top_offset[0], segments + 1, dtype=np.float32)
+    y_steps = np.linspace(0, top_offset[1], segments + 1, dtype=np.float32)
     z_steps = np.linspace(
         -height * center_offset,
         height * (1 - center_offset),
-        segments + 1
+        segments + 1,
+        dtype=np.float32
     )
 
-    last = len(r_steps) - 1
-    verts = []
-    for i, (r, x, y, z) in enumerate(zip(r_steps, x_steps, y_steps, z_steps)):
-        D.set_pos_hp_d(x, y, z, 0, 0, r)
-        if r == 0:
-            verts.append([m.add_vertex(D.pos, color)])
-            continue
-
-        if i == 0:
-            D.set_d(0)
-            verts.append([m.add_vertex(D.pos, color)])
-            D.set_d(r)
-
-        line = []
-        for h in h_steps:
-            D.set_hp_d(h, 0)
-            line.append(m.add_vertex(D.pos, color))
-        verts.append(line)
-
-        if i == last:
-            D.set_d(0)
-            verts.append([m.add_vertex(D.pos, color)])
+    # (segments + 1, 3) ring centers and (segments + 1, polygon, 3) rings
+    centers = ctx.points(0, 0, 0, x_steps, y_steps, z_steps)
+    rings = ctx.points(
+        h_steps[None, :],
+        0,
+        r_steps[:, None],
+        x_steps[:, None],
+        y_steps[:, None],
+        z_steps[:, None]
+    )
 
-    _populate_triangles(m, verts)
+    # Rings of radius 0 collapse to their center, open ends get closed by
+    # their center
+    lines = [
+        rings[i] if r else centers[i:i + 1]
+        for i, r in enumerate(r_steps)
+    ]
+    if r_steps[0]:
+        lines.insert(0, centers[:1])
+    if r_steps[-1]:
+        lines.append(centers[-1:])
+    _populate_triangles(m, _add_lines(m, lines, color))
     return m.export(False, edge_angle=80, normal_as_color=normal_as_color)
 
 
@@ -236,8 +548,8 @@ def cylinder(
     return cone(
         origin,
         direction,
-        polygon,
         (radius, radius),
+        polygon,
         height,
         segments,
         center_offset,
@@ -288,57 +600,42 @@ def sphere(
 
     segments = max(2, polygon // 2 + 1)  # TODO: account for partial sphere
     wrap_around = h_deg == 360
-    D.setup(origin, direction)
+    ctx = draw.make_context(origin, direction)
     m = mesh.Mesh('sphere')
-    p_steps = np.linspace(p_from_deg, p_to_deg, segments + 1)
-    h_steps = np.linspace(0, h_deg, polygon, endpoint=False)
-    last = len(p_steps) - 1
-    verts = []
-    h_slice = []
-    slice_top = None
-    slice_bottom = None
-    for i, p in enumerate(p_steps):
-        D.set_hp_d(h_offset, p, radius)
-        if i == 0:
-            if p == -90:
-                verts.append([m.add_vertex(D.pos, color)])
-            else:
-                verts.append([m.add_vertex(D.center_pos, color)])
-            if not wrap_around:
-                h_slice.append(verts[-1][-1])
-                slice_bottom = m[verts[-1][-1]].point
-            if p == -90:
-                continue
-
-        if i < last or p < 90:
-            line = []
-            for j, h in enumerate(h_steps):
-                D.set_hp_d(h + h_offset, p)
-                line.append(m.add_vertex(D.pos, color))
-                if not wrap_around:
-                    if j == 0:
-                        h_slice.insert(0, line[-1])
-                    elif j == polygon - 1:
-                        h_slice.append(line[-1])
-            verts.append(line)
-
-        if i == last:
-            if p == 90:
-                verts.append([m.add_vertex(D.pos, color)])
-            else:
-                verts.append([m.add_vertex(D.center_pos, color)])
-            if not wrap_around:
-                h_slice.append(verts[-1][-1])
-                slice_top = m[verts[-1][-1]].point
-
-    _populate_triangles(m, verts, wrap_around)
+    p_steps = np.linspace(p_from_deg, p_to_deg, segments + 1, dtype=np.float32)
+    h_steps = np.linspace(0, h_deg, polygon, endpoint=False, dtype=np.float32)
+    p_ends = p_steps[[0, -1]]
+    # Open ends are closed by their center on the axis instead of a pole
+    ends = np.where(
+        (np.abs(p_ends) == 90)[:, None],
+        ctx.points(h_offset, p_ends, radius),
+        ctx.points(0, 0, 0, z=radius * np.sin(np.radians(p_ends)))
+    )
+    rings = p_steps[(p_steps > -90) & (p_steps < 90)]
+    lines = [ends[:1]]
+    lines.extend(ctx.points(h_steps + h_offset, rings[:, None], radius))
+    lines.append(ends[1:])
     if not wrap_around:
-        center = (slice_top - slice_bottom) * 0.5 + slice_bottom
-        tmp_verts = [
-            [m.add_vertex(center, color)],
-            h_slice
-        ]
-        _populate_triangles(m, tmp_verts)
+        # Close the cut with a fan around the center of the axis
+        lines.append(((ends[1] - ends[0]) * 0.5 + ends[0])[None])
+    verts = _add_lines(m, lines, color)
+
+    if wrap_around:
+        triangles = _ring_triangles(verts)
+    else:
+        *verts, center = verts
+        # down the first vertex of every ring, up the last
+        h_slice = np.concatenate((
+            [v[0] for v in verts[-2:0:-1]],
+            verts[0],
+            [v[-1] for v in verts[1:-1]],
+            verts[-1]
+        ))
+        triangles = np.concatenate((
+            _ring_triangles(verts, False),
+            _ring_triangles([center, h_slice])
+        ))
+    m.add_triangles(triangles)
     return m.export(
         flat_shading=False,
         edge_angle=80,
@@ -408,50 +705,35 @@ def capsule(
     if not (0 <= center_offset <= 1):
         raise ValueError('center_offset must be in range 0..1')
 
-    D.setup(origin, direction)
-    D.set_d(radius)
+    ctx = draw.make_context(origin, direction)
     m = mesh.Mesh('capsule')
     c_segments = max(2, polygon // 4)
     b_segments = int((length - 2 * radius) / (radius / c_segments)) + 1
     f_steps = np.linspace(
         -center_offset * length + radius,
         (1.0 - center_offset) * length - radius,
-        b_segments + 1
+        b_segments + 1,
+        dtype=np.float32
     )
-    h_steps = np.linspace(0, 360, polygon, endpoint=False)
-    verts = []
-    last = len(f_steps) - 1
-    for i, f in enumerate(f_steps):
-        D.set_f(f)
-        if i == 0:
-            for p in np.linspace(-90, 0, c_segments, endpoint=False):
-                if p == -90:
-                    D.set_hp_d(0, p)
-                    verts.append([m.add_vertex(D.pos, color)])
-                    continue
-                line = []
-                for h in h_steps:
-                    D.set_hp_d(h, p)
-                    line.append(m.add_vertex(D.pos, color))
-                verts.append(line)
-
-        line = []
-        for h in h_steps:
-            D.set_hp_d(h, 0)
-            line.append(m.add_vertex(D.pos, color))
-        verts.append(line)
-
-        if i == last:
-            for p in np.linspace(90, 0, c_segments, endpoint=False)[::-1]:
-                if p == 90:
-                    D.set_hp_d(0, p)
-                    verts.append([m.add_vertex(D.pos, color)])
-                    continue
-                line = []
-                for h in h_steps:
-                    D.set_hp_d(h, p)
-                    line.append(m.add_vertex(D.pos, color))
-                verts.append(line)
+    h_steps = np.linspace(0, 360, polygon, endpoint=False, dtype=np.float32)
+    # Pitch and forward offset of every ring: bottom cap, body, top cap
+    cap = np.linspace(-90, 0, c_segments, endpoint=False, dtype=np.float32)[1:]
+    p_rings = np.concatenate((cap, np.zeros_like(f_steps), -cap[::-1]))
+    f_rings = np.concatenate((
+        np.full_like(cap, f_steps[0]),
+        f_steps,
+        np.full_like(cap, f_steps[-1])
+    ))
+    poles = ctx.points(0, [-90, 90], radius, z=f_steps[[0, -1]])
+    lines = [poles[:1]]
+    lines.extend(ctx.points(
+        h_steps[None, :],
+        p_rings[:, None],
+        radius,
+        z=f_rings[:, None]
+    ))
+    lines.append(poles[1:])
+    verts = _add_lines(m, lines, color)
     _populate_triangles(m, verts)
     return m.export(
         flat_shading=False,
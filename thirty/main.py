@@ -26,17 +26,25 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import random
 import sys
 
 from direct.showbase.ShowBase import ShowBase
+from panda3d.core import GeomNode
+from panda3d.core import NodePath
 from panda3d.core import Vec3
 from panda3d.core import Vec4
 from panda3d.core import AmbientLight
 from panda3d.core import DirectionalLight
 from direct.interval.LerpInterval import LerpHprInterval
 
+import numpy as np
+
 from . import geometry
+from . import mesh
+
+
+# Maximum number of rows per batch, also keeps the indices uint16
+_BATCH_ROWS = 0xffff
 
 
 class Thirty(ShowBase):
@@ -62,57 +70,109 @@ class Thirty(ShowBase):
         self.render.set_light(al_np)
         self.render.set_shader_auto(True)
         LerpHprInterval(dl_np, 5, (360, 0, 0)).loop()
+        self._rng = np.random.default_rng()
+        # key -> NodePath of geometry shared by all instances
+        self._geom_cache = {}
+        # Spawned shapes are appended to the open batch, one draw call each
+        self._batch = None
+        self._batch_node = None
+        self.new_batch()
+
+    def new_batch(self):
+        """
+        Start a new, empty batch Geom for `add_batched`. Earlier batches stay
+        in the scene graph as they are.
+        """
+        self._batch = mesh.VertexArray('batch')
+        self._batch_node = GeomNode('batch')
+        self.render.attach_new_node(self._batch_node)
+
+    def add_batched(self, node):
+        """
+        Append the geometry of `node` to the open batch Geom, instead of
+        attaching `node` to the scene graph. A new batch is started, when the
+        open one would exceed _BATCH_ROWS rows, so that the cost of an append
+        doesn't grow with the number of shapes spawned so far.
+
+        Args:
+            node: GeomNode
+        """
+        geoms = node.get_geoms()
+        num_rows = sum(g.get_vertex_data().get_num_rows() for g in geoms)
+        if self._batch.num_rows and (
+                self._batch.num_rows + num_rows > _BATCH_ROWS
+        ):
+            self.new_batch()
+        # Release the old Geom first, so appending doesn't copy on write
+        self._batch_node.remove_all_geoms()
+        for geom in geoms:
+            self._batch.add_geom(geom)
+        self._batch_node.add_geom(self._batch.get_geom())
+
+    def instance(self, key, build):
+        """
+        Return a new NodePath below render, that instances the geometry
+        cached under `key`. The geometry is created with `build()` and kept
+        out of the scene graph the first time `key` is requested.
+
+        Args:
+            key: hashable identifying the geometry
+            build: callable returning a GeomNode
+        """
+        if key not in self._geom_cache:
+            self._geom_cache[key] = NodePath(build())
+        node_path = self.render.attach_new_node(str(key))
+        self._geom_cache[key].instance_to(node_path)
+        return node_path
 
     def add_cube(self):
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-100, 100)
-        l = random.randint(1, 80)
-        w = random.randint(1, 80)
-        h = random.randint(1, 80)
-        self.render.attach_new_node(
+        x, y, z = self._rng.uniform(-100, 100, 3).tolist()
+        pos = Vec3(x, y, z)
+        direction = pos.normalized()
+        l, w, h = self._rng.integers(1, 81, 3).tolist()
+        self.add_batched(
             geometry.cuboid(
-                Vec3(x, y, z),
+                pos,
                 (l, w, h),
-                Vec3(x, y, z).normalized()
+                direction
             )
         )
 
     def add_prism(self):
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-100, 100)
-        r = random.uniform(1, 40)
-        l = random.randint(1, 80)
-        p = random.randint(3, 20)
-        s = random.randint(1, 10)
-        self.render.attach_new_node(
+        x, y, z = self._rng.uniform(-100, 100, 3).tolist()
+        pos = Vec3(x, y, z)
+        direction = pos.normalized()
+        r = float(self._rng.uniform(1, 40))
+        l = int(self._rng.integers(1, 81))
+        p = int(self._rng.integers(3, 21))
+        s = int(self._rng.integers(1, 11))
+        self.add_batched(
             geometry.prism(
-                Vec3(x, y, z),
+                pos,
                 p,
                 r,
                 l,
-                Vec3(x, y, z).normalized(),
+                direction,
                 segments=s
             )
         )
 
     def add_cone(self):
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-100, 100)
-        r1 = random.uniform(1, 40)
-        if random.random() < 0.5:
+        x, y, z = self._rng.uniform(-100, 100, 3).tolist()
+        pos = Vec3(x, y, z)
+        direction = pos.normalized()
+        r1 = float(self._rng.uniform(1, 40))
+        if self._rng.random() < 0.5:
             r2 = 0
         else:
-            r2 = random.uniform(1, 40)
-        l = random.randint(1, 80)
-        p = random.randint(12, 40)
-        s = random.randint(1, 10)
-        self.render.attach_new_node(
+            r2 = float(self._rng.uniform(1, 40))
+        l = int(self._rng.integers(1, 81))
+        p = int(self._rng.integers(12, 41))
+        s = int(self._rng.integers(1, 11))
+        self.add_batched(
             geometry.cone(
-                Vec3(x, y, z),
-                Vec3(x, y, z).normalized(),
+                pos,
+                direction,
                 (r1, r2),
                 p,
                 l,
@@ -121,17 +181,17 @@ class Thirty(ShowBase):
         )
 
     def add_capsule(self):
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-100, 100)
-        r = random.uniform(4, 40)
-        l = random.randint(int(3 * r), 140)
-        p = random.randint(12, 40)
-        c = random.uniform(0.01, 0.99)
-        self.render.attach_new_node(
+        x, y, z = self._rng.uniform(-100, 100, 3).tolist()
+        pos = Vec3(x, y, z)
+        direction = pos.normalized()
+        r = float(self._rng.uniform(4, 40))
+        l = int(self._rng.integers(int(3 * r), 141))
+        p = int(self._rng.integers(12, 41))
+        c = float(self._rng.uniform(0.01, 0.99))
+        self.add_batched(
             geometry.capsule(
-                Vec3(x, y, z),
-                Vec3(x, y, z).normalized(),
+                pos,
+                direction,
                 p,
                 r,
                 l,
@@ -140,52 +200,62 @@ class Thirty(ShowBase):
         )
 
     def add_dome(self):
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-100, 100)
-        r = random.uniform(4, 40)
-        p = random.randint(10, 30)
-        self.render.attach_new_node(
+        x, y, z = self._rng.uniform(-100, 100, 3).tolist()
+        pos = Vec3(x, y, z)
+        direction = pos.normalized()
+        r = float(self._rng.uniform(4, 40))
+        p = int(self._rng.integers(10, 31))
+        self.add_batched(
             geometry.dome(
-                Vec3(x, y, z),
-                Vec3(x, y, z).normalized(),
+                pos,
+                direction,
                 p,
                 r
             )
         )
 
     def add_sphere(self):
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-100, 100)
-        r = random.uniform(4, 40)
-        p = random.randint(10, 30)
-        if random.random() < 0.2:
+        x, y, z = self._rng.uniform(-100, 100, 3).tolist()
+        pos = Vec3(x, y, z)
+        direction = pos.normalized()
+        r = float(self._rng.uniform(4, 40))
+        p = int(self._rng.integers(10, 31))
+        if self._rng.random() < 0.2:
             h = 360
         else:
-            h = random.uniform(10, 350)
-        if random.random() < 0.2:
+            h = float(self._rng.uniform(10, 350))
+        if self._rng.random() < 0.2:
             p_from = -90
         else:
-            p_from = random.uniform(-80, 70)
-        if random.random() < 0.2:
+            p_from = float(self._rng.uniform(-80, 70))
+        if self._rng.random() < 0.2:
             p_to = 90
         else:
-            p_to = random.uniform(p_from + 10, 90)
-        self.render.attach_new_node(
+            p_to = float(self._rng.uniform(p_from + 10, 90))
+        self.add_batched(
             geometry.sphere(
-                Vec3(x, y, z),
-                Vec3(x, y, z).normalized(),
+                pos,
+                direction,
                 p,
                 r,
                 h,
                 p_from,
                 p_to,
-                random.uniform(0, 360)
+                float(self._rng.uniform(0, 360))
             )
         )
 
     def add_tree(self):
+        tree = self.instance('tree', self.build_tree)
+        x, y, z, s = self._rng.uniform(
+            (-100, -100, -2, 0.5),
+            (100, 100, 3, 2.5)
+        ).tolist()
+        tree.set_pos(x, y, z)
+        tree.set_scale(s)
+
+    @staticmethod
+    def build_tree():
         stem = geometry.cone(
             Vec3(0, 0, 0),
             Vec3(0, 0, 1),
@@ -210,15 +280,7 @@ class Thirty(ShowBase):
                 color=Vec4(0.08, 0.86, 0, 1),
                 normal_as_color=False
             ))
-        np = self.render.attach_new_node('tree')
-        for n in greens:
-            np.attach_new_node(n)
-        x = random.uniform(-100, 100)
-        y = random.uniform(-100, 100)
-        z = random.uniform(-2, 3)
-        s = random.uniform(0.5, 2.5)
-        np.set_pos(x, y, z)
-        np.set_scale(s)
+        return geometry.merge_nodes(greens, 'tree')
 
 
 if __name__ == '__main__':
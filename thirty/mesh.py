@@ -26,103 +26,503 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from collections import namedtuple
 from math import cos
 from math import radians
 
+from panda3d.core import GeomVertexArrayFormat
 from panda3d.core import GeomVertexFormat
 from panda3d.core import GeomVertexData
-from panda3d.core import GeomVertexWriter
 from panda3d.core import Geom
 from panda3d.core import GeomTriangles
 from panda3d.core import GeomNode
+from panda3d.core import InternalName
 from panda3d.core import Vec2
 from panda3d.core import Vec3
 from panda3d.core import Vec4
 
+import numpy as np
+
+from . import mesh_opt
 from . import tools
 
 
+_NUMERIC_TYPES = {
+    Geom.NT_uint8: np.uint8,
+    Geom.NT_uint16: np.uint16,
+    Geom.NT_uint32: np.uint32,
+    Geom.NT_float32: np.float32,
+}
+
+
+def _array_dtype(array_format):
+    """
+    Return a numpy structured dtype matching the row layout of a Panda3D
+    GeomVertexArrayFormat, to write vertex data through a memoryview.
+
+    Args:
+        array_format: GeomVertexArrayFormat
+    """
+    names, formats, offsets = [], [], []
+    for column in array_format.get_columns():
+        names.append(column.get_name().get_name())
+        formats.append((
+            _NUMERIC_TYPES[column.get_numeric_type()],
+            column.get_num_components()
+        ))
+        offsets.append(column.get_start())
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': array_format.get_stride()
+    })
+
+
+def _soa_format():
+    """
+    Return a registered GeomVertexFormat with the same columns as v3n3c4t2,
+    but with positions, normals and color/texcoord in separate arrays, so
+    that position only passes don't have to stride over the other columns.
+    """
+    arrays = (
+        ((InternalName.get_vertex(), 3, Geom.NT_float32, Geom.C_point),),
+        ((InternalName.get_normal(), 3, Geom.NT_float32, Geom.C_normal),),
+        (
+            (InternalName.get_color(), 4, Geom.NT_uint8, Geom.C_color),
+            (InternalName.get_texcoord(), 2, Geom.NT_float32,
+             Geom.C_texcoord),
+        ),
+    )
+    vertex_format = GeomVertexFormat()
+    for columns in arrays:
+        array_format = GeomVertexArrayFormat()
+        for column in columns:
+            array_format.add_column(*column)
+        vertex_format.add_array(array_format)
+    return GeomVertexFormat.register_format(vertex_format)
+
+
+_FORMAT = GeomVertexFormat.get_v3n3c4t2()
+_SOA_FORMAT = _soa_format()
+_ARRAY_DTYPES = {
+    vertex_format: [
+        _array_dtype(vertex_format.get_array(i))
+        for i in range(vertex_format.get_num_arrays())
+    ]
+    for vertex_format in (_FORMAT, _SOA_FORMAT)
+}
+_UH_STATIC = Geom.UH_static
+# Average number of uses per row below which optimize_cache is skipped
+_MIN_ROW_REUSE = 1.5
+# Normal of vertices, that smooth shading hasn't assigned one to yet
+_UNSET_NORMAL = -2.0
+# Points are keyed by their float32 coordinates rounded to a grid with this
+# many cells per unit, points in the same grid cell share their vertices
+_POINT_KEY_SCALE = 1e4
+
+
 # noinspection PyArgumentList
 class VertexArray(object):
-    def __init__(self, name='Unnamed Shape'):
+    """
+    Vertex data and triangles of a single Geom, written in bulk from numpy.
+
+    Args:
+        name: name of the resulting GeomNode
+        soa: whether to use one array per attribute (positions, normals and
+            color/texcoord), instead of the interleaved v3n3c4t2 format.
+        num_rows: number of rows to allocate memory for up front
+    """
+    def __init__(self, name='Unnamed Shape', soa=True, num_rows=0):
         self._name = name
+        vertex_format = _SOA_FORMAT if soa else _FORMAT
+        self._dtypes = _ARRAY_DTYPES[vertex_format]
         self._vert_data = GeomVertexData(
             self._name,
-            GeomVertexFormat.get_v3n3c4t2(),
-            Geom.UH_static
+            vertex_format,
+            _UH_STATIC
         )
-        self._vert_writer = GeomVertexWriter(self._vert_data, 'vertex')
-        self._norm_writer = GeomVertexWriter(self._vert_data, 'normal')
-        self._color_writer = GeomVertexWriter(self._vert_data, 'color')
-        self._tex_writer = GeomVertexWriter(self._vert_data, 'texcoord')
-        self._prim = GeomTriangles(Geom.UH_static)
+        self._prim = GeomTriangles(_UH_STATIC)
+        if num_rows:
+            self.reserve(num_rows)
 
-        self._v_id = 0
+    @property
+    def num_rows(self):
+        return self._vert_data.get_num_rows()
 
-    def set_num_rows(self, num_rows):
-        self._vert_data.set_num_rows(num_rows)
+    def reserve(self, num_rows=0, num_indices=0):
+        """
+        Allocate memory for at least `num_rows` rows and `num_indices`
+        triangle indices in total, so that bulk writes up to that size don't
+        need to reallocate.
 
-    def add_row(self, point, normal, color, tex):
-        self._vert_writer.add_data3(point)
-        self._norm_writer.add_data3(normal)
-        self._color_writer.add_data4(color)
-        self._tex_writer.add_data2(tex)
-        self._v_id += 1
-        return self._v_id - 1
+        Args:
+            num_rows: int
+            num_indices: int
+        """
+        if num_rows:
+            self._vert_data.reserve_num_rows(num_rows)
+        if num_indices:
+            if num_rows > 0xffff:
+                self._prim.set_index_type(Geom.NT_uint32)
+            self._prim.reserve_num_vertices(num_indices)
+
+    def set_rows(self, points, normals, colors, tex_coords):
+        """
+        Replace the vertex data with a single bulk write into the underlying
+        array, instead of one GeomVertexWriter call per column and row.
 
-    def add_triangle(self, va, vb, vc):
-        self._prim.add_vertices(va, vb, vc)
+        Args:
+            points: array like of shape (N, 3)
+            normals: array like of shape (N, 3)
+            colors: array like of shape (N, 4) or (N, 3) for opaque colors,
+                with components in 0..1
+            tex_coords: array like of shape (N, 2)
+        """
+        self._vert_data.unclean_set_num_rows(0)
+        self.add_rows(points, normals, colors, tex_coords)
 
-    def get_node(self):
+    def add_rows(self, points, normals, colors, tex_coords):
+        """
+        Return the row id of the first of the appended rows. Like `set_rows`,
+        but keeps the rows already present.
+
+        Args:
+            points: array like of shape (N, 3)
+            normals: array like of shape (N, 3)
+            colors: array like of shape (N, 4) or (N, 3) for opaque colors,
+                with components in 0..1
+            tex_coords: array like of shape (N, 2)
+        """
+        start = self._vert_data.get_num_rows()
+        if start:
+            self._vert_data.set_num_rows(start + len(points))
+        else:
+            self._vert_data.unclean_set_num_rows(len(points))
+        colors = np.asarray(colors, np.float32)
+        if colors.shape[-1] == 3:
+            # opaque, i.e. normals used as color
+            colors = np.concatenate(
+                (colors, np.ones(colors.shape[:-1] + (1,), np.float32)),
+                axis=-1
+            )
+        columns = {
+            'vertex': points,
+            'normal': normals,
+            # Same truncation as GeomVertexWriter when packing to uint8
+            'color': np.clip(colors * 255, 0, 255),
+            'texcoord': tex_coords,
+        }
+        for i, dtype in enumerate(self._dtypes):
+            rows = np.frombuffer(
+                memoryview(self._vert_data.modify_array(i)).cast('B'),
+                dtype
+            )[start:]
+            for name in dtype.names:
+                rows[name] = columns[name]
+        return start
+
+    def set_triangles(self, indices):
+        """
+        Replace the index buffer of the primitive with a single bulk write,
+        instead of one `add_vertices` call per triangle.
+
+        Args:
+            indices: array like of vertex ids, three per triangle
+        """
+        self._prim.clear_vertices()
+        self.add_triangles(indices)
+
+    def add_triangles(self, indices):
+        """
+        Append to the index buffer of the primitive with a single bulk write.
+
+        Args:
+            indices: array like of vertex ids, three per triangle
+        """
+        indices = np.asarray(indices).reshape(-1)
+        # 0xffff is reserved as strip cut index
+        if self._vert_data.get_num_rows() <= 0xffff:
+            index_type, dtype = Geom.NT_uint16, np.uint16
+        else:
+            index_type, dtype = Geom.NT_uint32, np.uint32
+        if self._prim.get_index_type() != index_type:
+            self._prim.set_index_type(index_type)
+        handle = self._prim.modify_vertices()
+        start = handle.get_num_rows()
+        handle.set_num_rows(start + len(indices))
+        np.frombuffer(memoryview(handle).cast('B'), dtype)[start:] = indices
+
+    def add_geom(self, geom):
+        """
+        Return the row id of the first of the appended rows. Append the vertex
+        data and triangles of `geom`, e.g. taken from another shape's
+        GeomNode, with one bulk copy per array. Other vertex formats are
+        converted first.
+
+        Args:
+            geom: Geom with triangle primitives
+        """
+        vert_data = geom.get_vertex_data()
+        vertex_format = self._vert_data.get_format()
+        if vert_data.get_format() != vertex_format:
+            vert_data = vert_data.convert_to(vertex_format)
+        start = self._vert_data.get_num_rows()
+        if start:
+            self._vert_data.set_num_rows(start + vert_data.get_num_rows())
+        else:
+            self._vert_data.unclean_set_num_rows(vert_data.get_num_rows())
+        for i, dtype in enumerate(self._dtypes):
+            rows = np.frombuffer(
+                memoryview(self._vert_data.modify_array(i)).cast('B'),
+                dtype
+            )
+            rows[start:] = np.frombuffer(
+                memoryview(vert_data.get_array(i)).cast('B'),
+                dtype
+            )
+        for prim in geom.get_primitives():
+            prim = prim.decompose()
+            if prim.is_indexed():
+                indices = np.frombuffer(
+                    memoryview(prim.get_vertices()).cast('B'),
+                    _NUMERIC_TYPES[prim.get_index_type()]
+                )
+            else:
+                indices = np.arange(prim.get_num_vertices())
+                indices += prim.get_first_vertex()
+            self.add_triangles(indices.astype(np.int64) + start)
+        return start
+
+    def get_geom(self):
+        """
+        Return a Geom of the vertex data and triangles. The Geom shares them
+        with this VertexArray, so rows and triangles appended later show up
+        in a Geom fetched later, without copying what is already there.
+        """
         geom = Geom(self._vert_data)
         geom.add_primitive(self._prim)
+        return geom
+
+    def get_node(self):
         node = GeomNode(self._name)
-        node.add_geom(geom)
+        node.add_geom(self.get_geom())
         return node
 
 
+def _point_keys(points):
+    """
+    Return a list of int 3-Tuples to identify points by, with every
+    coordinate cast to float32, then rounded to the grid of
+    _POINT_KEY_SCALE in float64, so a point gets the same key no matter
+    what type it is passed as.
+
+    Args:
+        points: array like of shape (N, 3)
+    """
+    keys = np.rint(
+        np.asarray(points, np.float32).reshape(-1, 3)
+        * np.float64(_POINT_KEY_SCALE)
+    )
+    return list(map(tuple, keys.astype(np.int64).tolist()))
+
+
+def _reserve(array, size, fill=None):
+    """
+    Return `array`, or a copy with room for at least `size` rows if it is too
+    small. Grows by doubling, so repeated appends stay amortized O(1).
+
+    Args:
+        array: ndarray
+        size: int minimum number of rows
+        fill: Optional value for the new rows, left uninitialized otherwise
+    """
+    if size <= len(array):
+        return array
+    grown = np.empty(
+        (max(size, 2 * len(array)), ) + array.shape[1:],
+        array.dtype
+    )
+    grown[:len(array)] = array
+    if fill is not None:
+        grown[len(array):] = fill
+    return grown
+
+
+def _unique_rows(*columns):
+    """
+    Return 2-Tuple of the row ids of the first occurrence of every distinct
+    row across `columns` (in order of appearance) and, for every row, the
+    position of its distinct row in that selection. Rows are compared by
+    their exact float32 values.
+
+    Args:
+        *columns: 2D array likes with the same number of rows
+    """
+    rows = np.concatenate(
+        [np.asarray(c, np.float32) for c in columns],
+        axis=1
+    ) + np.float32(0)  # -0.0 -> 0.0
+    keys = np.ascontiguousarray(rows).view(
+        np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))
+    ).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+
 class Mesh(object):
     """
     Container for data related to the mesh. Provides export to Panda Node.
+
+    Vertex attributes and triangles are stored as parallel numpy arrays (SoA)
+    that grow by doubling, vertex ids are row numbers into them.
     """
 
     def __init__(self, name='unnamed shape'):
         self._name = name
+        # quantized point -> {(*color, *tex_coord): vertex id}
         self._points = {}
-        self._vertices = {}
-        self._triangles = {}
+        self._pos = np.empty((64, 3), np.float32)
+        self._col = np.empty((64, 4), np.float32)
+        self._tex = np.empty((64, 2), np.float32)
+        self._nrm = np.full((64, 3), _UNSET_NORMAL, np.float32)
         self._v_id = 0
+        self._tri = np.empty((64, 3), np.int32)
+        self._tri_nm = np.empty((64, 3), np.float32)
+        self._tri_n = np.empty((64, 3), np.float32)
         self._t_id = 0
+        # triangles with up to date _tri_nm / _tri_n
+        self._n_id = 0
+        # export options -> Geom
+        self._export_cache = {}
+
+    def reserve(self, num_vertices=0, num_triangles=0):
+        """
+        Make room for at least `num_vertices` vertices and `num_triangles`
+        triangles in total, so that adding up to that many needs no further
+        reallocation.
+
+        Args:
+            num_vertices: int
+            num_triangles: int
+        """
+        self._pos = _reserve(self._pos, num_vertices)
+        self._col = _reserve(self._col, num_vertices)
+        self._tex = _reserve(self._tex, num_vertices)
+        self._nrm = _reserve(self._nrm, num_vertices, _UNSET_NORMAL)
+        self._tri = _reserve(self._tri, num_triangles)
+        self._tri_nm = _reserve(self._tri_nm, num_triangles)
+        self._tri_n = _reserve(self._tri_n, num_triangles)
 
     def add_vertex(self, point, color=Vec4(1), tex_coord=Vec2(0)):
         """
-        Return vertex id, while avoiding duplicate vertices.
+        Return vertex id, while avoiding duplicate vertices. Points in the
+        same cell of a grid with _POINT_KEY_SCALE cells per unit, i.e. that
+        only differ by float noise, count as duplicates.
 
         Args:
             point: Vec3
             color: Vec4
             tex_coord: Vec2 texture coordinates
         """
-        if point not in self._points:
-            self._points[point] = self._Point(point)
-        return self._points[point].add_vertex(color, tex_coord, self)
+        key, = _point_keys(tuple(point))
+        c_id = (*color, *tex_coord)
+        return self._add_vertex(key, c_id, point, color, tex_coord)
+
+    def add_vertices(self, points, color=Vec4(1), tex_coord=Vec2(0)):
+        """
+        Return a list of vertex ids for an array of points, while avoiding
+        duplicate vertices like `add_vertex`.
+
+        Args:
+            points: array like of shape (N, 3)
+            color: Vec4
+            tex_coord: Vec2 texture coordinates
+        """
+        points = np.asarray(points, np.float32).reshape(-1, 3)
+        keys = _point_keys(points)
+        c_id = (*color, *tex_coord)
+        self.reserve(self._v_id + len(points))
+        return [
+            self._add_vertex(k, c_id, p, color, tex_coord)
+            for k, p in zip(keys, points.tolist())
+        ]
+
+    def _add_vertex(self, key, c_id, point, color, tex_coord):
+        """
+        Return the vertex id of `c_id` at the point `key`, after inserting it
+        if it doesn't exist yet.
+        """
+        combinations = self._points.setdefault(key, {})
+        v_id = combinations.get(c_id)
+        if v_id is None:
+            v_id = combinations[c_id] = self.insert_unique_vertex(
+                point,
+                color,
+                tex_coord
+            )
+        return v_id
 
     def add_triangle(self, va, vb, vc):
         """Return triangle id."""
-        self._triangles[self._t_id] = self._Triangle(
-            self._vertices[va],
-            self._vertices[vb],
-            self._vertices[vc]
+        return self.add_triangles([(va, vb, vc)])[0]
+
+    def add_triangles(self, triangles):
+        """
+        Return a list of triangle ids.
+
+        Args:
+            triangles: array like of vertex ids with shape (N, 3)
+        """
+        triangles = np.asarray(triangles, np.int32).reshape(-1, 3)
+        if triangles.size and (
+                triangles.min() < 0 or triangles.max() >= self._v_id
+        ):
+            raise IndexError('vertex id out of range')
+        start, end = self._t_id, self._t_id + len(triangles)
+        self.reserve(num_triangles=end)
+        self._tri[start:end] = triangles
+        self._t_id = end
+        self._export_cache.clear()
+        return list(range(start, end))
+
+    def _update_face_normals(self):
+        """
+        Compute the face normals of all triangles added since the last call
+        in one batch. Deferred from `add_triangles`, so that meshes built one
+        triangle at a time don't pay for a numpy call per triangle.
+        """
+        start, end = self._n_id, self._t_id
+        if start == end:
+            return
+        points = self._pos[self._tri[start:end]]
+        normals_mag = tools.tri_face_norms(
+            points[:, 0],
+            points[:, 1],
+            points[:, 2],
+            False
+        )
+        length = np.linalg.norm(normals_mag, axis=1, keepdims=True)
+        self._tri_nm[start:end] = normals_mag
+        self._tri_n[start:end] = np.divide(
+            normals_mag,
+            length,
+            out=np.zeros_like(normals_mag),
+            where=length > 0
         )
-        self._t_id += 1
-        return self._t_id - 1
+        self._n_id = end
 
     def export(
             self,
             flat_shading=True,
             flat_color=True,
             edge_angle=80.0,
-            normal_as_color=False
+            normal_as_color=False,
+            optimize_cache=False,
+            dedup=True
     ):
         """
         Return a Panda3D Node of the mesh. By default uses face normals with
@@ -134,42 +534,88 @@ class Mesh(object):
             flat_color: bool
             edge_angle: angle in degrees at which to make sharp edges.
             normal_as_color: whether to use the vertex normal as color.
+            optimize_cache: whether to reorder triangles for the GPU vertex
+                cache and rows by first use, see `mesh_opt`. Skipped if rows
+                are used by fewer than _MIN_ROW_REUSE triangle corners on
+                average, e.g. flat shading of a curved surface.
+            dedup: whether flat shading merges identical triangle corners,
+                e.g. of coplanar neighbours, into shared rows. Costs a sort
+                of all corners, that only pays off if many of them match.
         """
-        va = VertexArray(self._name)
+        # Repeated exports with the same options share one Geom, until the
+        # mesh changes
+        key = (
+            flat_shading,
+            flat_color,
+            None if flat_shading else edge_angle,
+            normal_as_color,
+            optimize_cache,
+            dedup if flat_shading else None
+        )
+        if key not in self._export_cache:
+            self._export_cache[key] = self._export_geom(*key)
+        node = GeomNode(self._name)
+        node.add_geom(self._export_cache[key])
+        return node
+
+    def _export_geom(
+            self,
+            flat_shading,
+            flat_color,
+            edge_angle,
+            normal_as_color,
+            optimize_cache,
+            dedup
+    ):
+        """Return a new Geom of the mesh. Arguments as in `export`."""
+        self._update_face_normals()
         if flat_shading:
-            va.set_num_rows(self._t_id * 3)
-            for t in self._triangles.values():
-                c = None
-                if flat_color and not normal_as_color:
-                    c = Vec4(0)
-                    for v in t:
-                        c += v.color
-                    c /= 3
-                elif normal_as_color:
-                    c = Vec4(*tuple(t.normal), 1.0)
-                t_v = [
-                    va.add_row(
-                        v.point,
-                        t.normal,
-                        c if flat_color else v.color,
-                        v.tex_coord
-                    ) for v in t
-                ]
-                va.add_triangle(*t_v)
+            corners = self._tri[:self._t_id].reshape(-1)
+            normals = np.repeat(self._tri_n[:self._t_id], 3, axis=0)
+            if flat_color and normal_as_color:
+                colors = normals
+            else:
+                colors = self._col[corners]
+                if flat_color:
+                    colors = colors.reshape(-1, 3, 4).mean(axis=1)
+                    colors = np.repeat(colors, 3, axis=0)
+            columns = self._pos[corners], normals, colors, self._tex[corners]
+            if dedup:
+                # Corners of coplanar neighbours end up identical, share them
+                rows, indices = _unique_rows(*columns)
+                columns = tuple(c[rows] for c in columns)
+            else:
+                indices = np.arange(len(corners))
         else:
             self._compute_smooth_normals(edge_angle)
-            va.set_num_rows(self._v_id)
-            v2v = {}
-            for v in self._vertices.values():
-                if normal_as_color:
-                    c = Vec4(*tuple(v.normal), 1.0)
-                else:
-                    c = v.color
-                v2v[v] = va.add_row(v.point, v.normal, c, v.tex_coord)
-            for t in self._triangles.values():
-                triangle = [v2v[v] for v in t]
-                va.add_triangle(*triangle)
-        return va.get_node()
+            normals = self._nrm[:self._v_id]
+            if normal_as_color:
+                colors = normals
+            else:
+                colors = self._col[:self._v_id]
+            columns = (
+                self._pos[:self._v_id],
+                normals,
+                colors,
+                self._tex[:self._v_id]
+            )
+            indices = self._tri[:self._t_id]
+        # Reordering only pays off when rows are shared between triangles,
+        # which flat shading mostly does for coplanar neighbours only
+        if optimize_cache and (
+                np.size(indices) >= _MIN_ROW_REUSE * len(columns[0])
+        ):
+            indices = mesh_opt.optimize_vertex_cache(indices)
+            rows, indices = mesh_opt.optimize_vertex_fetch(
+                indices,
+                len(columns[0])
+            )
+            columns = tuple(c[rows] for c in columns)
+        va = VertexArray(self._name)
+        va.reserve(len(columns[0]), indices.size)
+        va.set_rows(*columns)
+        va.set_triangles(indices)
+        return va.get_geom()
 
     def _compute_smooth_normals(self, edge_angle):
         """
@@ -180,98 +626,231 @@ class Mesh(object):
             edge_angle: angle in degrees above which vertices are duplicated.
         """
         split_cos = cos(radians(edge_angle))
-        for p in self._points.values():
-            tris = {
-                t: self._vertices[v_id]
-                for v_id in p.vertices
-                for t in self._vertices[v_id].triangles
-            }
-
-            groups = self._compute_normal_groups(tris, split_cos)
-            v2n = self._compute_vertex_duplication(tris, groups)
-
-            for v in v2n:
-                if len(v2n[v]) < 2:
-                    v.normal = list(v2n[v].keys())[0]
-                    continue
-                first = True
-                for n in v2n[v]:
-                    if first:
-                        first = False
-                        v.normal = n
-                        continue
-                    new_id = self.insert_unique_vertex(
-                        v.point,
-                        v.color,
-                        v.tex_coord
-                    )
-                    self._vertices[new_id].normal = n
-                    for t in v2n[v][n]:
-                        t.replace_vertex(v, self._vertices[new_id])
-                        v.remove_from_triangle(t)
+        indptr, point_tris, point_verts = self._point_triangles()
+        normals = self._tri_n[:self._t_id]
+        counts = np.diff(indptr)
+        if split_cos <= -1.0:
+            # Any two faces are within edge_angle, no point has sharp edges
+            smooth = np.ones(len(counts), bool)
+        else:
+            smooth = self._smooth_points(
+                normals,
+                indptr,
+                point_tris,
+                split_cos
+            )
+
+        # Points without a sharp edge: one summed normal for all vertices
+        used = counts > 0
+        sums = np.add.reduceat(
+            self._tri_nm[point_tris].astype(np.float64),
+            indptr[:-1][used]
+        )[smooth[used]]
+        length = np.linalg.norm(sums, axis=1, keepdims=True)
+        sums = np.divide(sums, length, out=sums, where=length > 0)
+        self._nrm[point_verts[np.repeat(smooth, counts)]] = np.repeat(
+            sums,
+            counts[smooth & used],
+            axis=0
+        )
+
+        # Points with sharp edges, triangles grouped one point at a time
+        all_groups = []
+        keep_ids, keep_groups = [], []
+        copy_ids, copy_groups, copy_tris = [], [], []
+        for p in np.flatnonzero(~smooth).tolist():
+            start, end = indptr[p], indptr[p + 1]
+            tris = dict(zip(
+                point_tris[start:end].tolist(),
+                point_verts[start:end].tolist()
+            ))
+
+            groups = self._compute_normal_groups(
+                list(tris),
+                normals,
+                split_cos
+            )
+            v2g = self._compute_vertex_duplication(
+                tris,
+                groups,
+                len(all_groups)
+            )
+            all_groups.extend(groups)
+
+            # The first group keeps the vertex, every other one gets a copy
+            for v, ((g_id, _), *others) in v2g.items():
+                keep_ids.append(v)
+                keep_groups.append(g_id)
+                for g_id, group in others:
+                    copy_ids.append(v)
+                    copy_groups.append(g_id)
+                    copy_tris.append(group)
+
+        if not all_groups:
+            return
+        group_normals = self._group_normals(
+            all_groups,
+            self._tri_nm[:self._t_id]
+        )
+        self._nrm[keep_ids] = group_normals[keep_groups]
+        if copy_ids:
+            self._duplicate_vertices(
+                copy_ids,
+                group_normals[copy_groups],
+                copy_tris
+            )
 
     @staticmethod
-    def _compute_vertex_duplication(triangles, groups):
+    def _group_normals(groups, normals_mag):
         """
-        Return a dict, that is mapping unique combinations of vertex, normal and
-        the corresponding triangles.
+        Return the normalized sum of the face normals in each group, as
+        ndarray of shape (G, 3), with a single np.add.reduceat over all
+        groups.
 
         Args:
-            triangles:
-            groups:
-        Returns: v2n[vertex][normal] = [triangle, ...]
+            groups: non empty list of non empty triangle id lists
+            normals_mag: ndarray (T, 3) of unnormalized face normals
         """
-        normals = []
-        for g in groups:
-            n = Vec3(0)
-            for t in g:
-                n += t.normal_mag
-            normals.append(n.normalized())
-        v2n = {}
-        for g, n in zip(groups, normals):
+        sizes = [len(g) for g in groups]
+        tris = np.fromiter((t for g in groups for t in g), np.int64)
+        starts = np.cumsum([0] + sizes[:-1])
+        sums = np.add.reduceat(normals_mag[tris].astype(np.float64), starts)
+        length = np.linalg.norm(sums, axis=1, keepdims=True)
+        return np.divide(sums, length, out=sums, where=length > 0)
+
+    def _duplicate_vertices(self, vertices, normals, triangles):
+        """
+        Append copies of `vertices` with new `normals` and let the given
+        triangles use the copies instead, all in bulk.
+
+        Args:
+            vertices: list of vertex ids to copy
+            normals: list of normals of the copies
+            triangles: list of triangle id lists, that switch to the copies
+        """
+        start = self._v_id
+        end = start + len(vertices)
+        self.reserve(end)
+        self._pos[start:end] = self._pos[vertices]
+        self._col[start:end] = self._col[vertices]
+        self._tex[start:end] = self._tex[vertices]
+        self._nrm[start:end] = normals
+        self._v_id = end
+        self._export_cache.clear()
+
+        sizes = [len(g) for g in triangles]
+        tris = np.fromiter((t for g in triangles for t in g), np.int64)
+        old = np.repeat(vertices, sizes)
+        rows = self._tri[tris]
+        self._tri[tris, (rows == old[:, None]).argmax(axis=1)] = np.repeat(
+            np.arange(start, end),
+            sizes
+        )
+
+    def _point_triangles(self):
+        """
+        Return the triangles incident to each point in CSR layout, as 3-Tuple
+        of int arrays: offsets (P + 1, ) into the other two, the triangle ids
+        and, for each of them, the vertex id the point has in that triangle.
+        Per point, triangles are ordered by vertex id, then triangle id, and
+        only listed once. Vertices not created by `add_vertex` are skipped.
+        """
+        num_tris = self._t_id
+        combinations = list(self._points.values())
+        vertex_point = np.full(self._v_id, -1, np.int64)
+        vertex_point[np.fromiter(
+            (v for c in combinations for v in c.values()),
+            np.int64
+        )] = np.repeat(
+            np.arange(len(combinations)),
+            [len(c) for c in combinations]
+        )
+        corners = self._tri[:num_tris].reshape(-1)
+        corner_point = vertex_point[corners]
+        # Stable, i.e. ascending triangle ids for the same point and vertex
+        order = np.lexsort((corners, corner_point))
+        # A triangle can touch several vertices of a point, keep the first
+        _, first = np.unique(
+            corner_point[order] * num_tris + order // 3,
+            return_index=True
+        )
+        order = order[np.sort(first)]
+        order = order[corner_point[order] >= 0]
+        indptr = np.searchsorted(
+            corner_point[order],
+            np.arange(len(combinations) + 1)
+        )
+        return indptr, order // 3, corners[order]
+
+    @staticmethod
+    def _compute_vertex_duplication(triangles, groups, first_id=0):
+        """
+        Return a dict, that is mapping each vertex to a list of unique
+        (group id, triangles) combinations, in group order.
+
+        Args:
+            triangles: dict triangle id -> vertex id
+            groups: list of triangle id lists
+            first_id: group id of the first group in `groups`
+        Returns: v2g[vertex] = [(group id, [triangle, ...]), ...]
+        """
+        v2g = {}
+        for g_id, g in enumerate(groups, first_id):
             for t in g:
-                if triangles[t] in v2n:
-                    if n not in v2n[triangles[t]]:
-                        v2n[triangles[t]][n] = [t]
-                    else:
-                        v2n[triangles[t]][n].append(t)
+                combos = v2g.setdefault(triangles[t], [])
+                if not combos or combos[-1][0] != g_id:
+                    combos.append((g_id, [t]))
                 else:
-                    v2n[triangles[t]] = {n: [t]}
-        return v2n
+                    combos[-1][1].append(t)
+        return v2g
 
     @staticmethod
-    def _compute_normal_groups(triangles, split_cos):
+    def _smooth_points(normals, indptr, point_tris, split_cos):
         """
-        Return a list of triangle lists where every group leads to a different
-        vertex normal.
+        Return a bool array (P, ) telling for each point, whether all of its
+        triangles end up in a single normal group, i.e. whether every pair of
+        them meets at an angle within `split_cos`. Points with the same
+        number of triangles are tested together with one batched `N @ N.T`.
 
         Args:
-            triangles: dict
+            normals: ndarray (T, 3) of face normals by triangle id
+            indptr: ndarray (P + 1, ) offsets into `point_tris`
+            point_tris: ndarray of triangle ids per point, see
+                `_point_triangles`
             split_cos: cos of the angle when to create sharp edges
+        """
+        counts = np.diff(indptr)
+        smooth = np.ones(len(counts), bool)
+        for k in np.unique(counts[counts > 1]).tolist():
+            points = np.flatnonzero(counts == k)
+            n = normals[point_tris[indptr[points, None] + np.arange(k)]]
+            dots = n @ n.transpose(0, 2, 1)
+            smooth[points] = (dots >= split_cos).all(axis=(1, 2))
+        return smooth
 
-        Returns:
+    @staticmethod
+    def _compute_normal_groups(triangles, normals, split_cos):
+        """
+        Return a list of triangle lists where every group leads to a different
+        vertex normal. A triangle joins the first group, that it is within
+        `split_cos` of with every member.
 
+        Args:
+            triangles: list of triangle ids
+            normals: ndarray (T, 3) of face normals by triangle id
+            split_cos: cos of the angle when to create sharp edges
         """
+        n = normals[triangles]
+        compatible = (n @ n.T >= split_cos).tolist()
         groups = []
-        for t in triangles:
-            if not groups:
-                groups.append([t])
-                continue
-            g_id = -1
-            t_normal = t.normal
-            for i, g in enumerate(groups):
-                g_id = i
-                for tt in g:
-                    if t_normal.dot(tt.normal) < split_cos:  # inner angle
-                        g_id = -1
-                        break
-                if g_id == i:
+        for i, row in enumerate(compatible):
+            for g in groups:
+                if all(row[j] for j in g):
+                    g.append(i)
                     break
-            if g_id != -1:
-                groups[g_id].append(t)
             else:
-                groups.append([t])
-        return groups
+                groups.append([i])
+        return [[triangles[i] for i in g] for g in groups]
 
     def insert_unique_vertex(self, point, color, tex_coord):
         """
@@ -282,137 +861,23 @@ class Mesh(object):
             color: Vec4
             tex_coord: Vec2
         """
-        self._vertices[self._v_id] = self._Vertex(point, color, tex_coord)
+        v_id = self._v_id
+        self.reserve(v_id + 1)
+        self._pos[v_id] = tuple(point)
+        self._col[v_id] = tuple(color)
+        self._tex[v_id] = tuple(tex_coord)
         self._v_id += 1
-        return self._v_id - 1
+        self._export_cache.clear()
+        return v_id
 
     def __getitem__(self, item):
         if item in range(self._v_id):
-            return self._vertices[item]
+            return self._Vertex(
+                Vec3(*self._pos[item]),
+                Vec4(*self._col[item]),
+                Vec2(*self._tex[item]),
+                Vec3(*self._nrm[item])
+            )
         raise IndexError
 
-    class _Triangle(object):
-        def __init__(self, va, vb, vc):
-            self._va = va
-            self._vb = vb
-            self._vc = vc
-            va.add_to_triangle(self)
-            vb.add_to_triangle(self)
-            vc.add_to_triangle(self)
-            self._normal_mag = tools.tri_face_norm(
-                va.point,
-                vb.point,
-                vc.point,
-                False
-            )
-            self._normal = self._normal_mag.normalized()
-
-        def replace_vertex(self, old, new):
-            """
-            Replaces a vertex in the triangle. Raises a ValueError if the `old`
-            is not a vertex of this triangle.
-
-            Args:
-                old: the old Vertex to be replaced
-                new: the replacement Vertex
-            """
-            if self._va == old:
-                self._va = new
-            elif self._vb == old:
-                self._vb = new
-            elif self._vc == old:
-                self._vc = new
-            else:
-                raise ValueError('old is not a vertex of this triangle.')
-            new.add_to_triangle(self)
-
-        @property
-        def normal(self):
-            return self._normal
-
-        @property
-        def normal_mag(self):
-            return self._normal_mag
-
-        def __getitem__(self, item):
-            if item == 0:
-                return self._va
-            elif item == 1:
-                return self._vb
-            elif item == 2:
-                return self._vc
-            else:
-                raise IndexError
-
-        def __setitem__(self, key, value):
-            if key == 0:
-                self._va = value
-            elif key == 1:
-                self._vb = value
-            elif key == 2:
-                self._vc = value
-            else:
-                raise IndexError
-
-    class _Point(object):
-        def __init__(self, point):
-            self._point = point
-            self._combinations = {}
-            self._vertex_normals = []
-
-        def add_vertex(self, color, tex_coord, mesh):
-            c_id = (color, tex_coord)
-            if c_id in self._combinations:
-                return self._combinations[c_id]
-            self._combinations[c_id] = mesh.insert_unique_vertex(
-                self._point,
-                color,
-                tex_coord
-            )
-            return self._combinations[c_id]
-
-        @property
-        def vertices(self):
-            return self._combinations.values()
-
-    class _Vertex(object):
-        def __init__(self, point, color, tex_coord):
-            self._point = point
-            self._color = color
-            self._tex_coord = tex_coord
-            self._triangles = []
-            self._triangle_groups = []
-            self._normal = Vec3(-2)
-
-        def add_to_triangle(self, triangle):
-            self._triangles.append(triangle)
-
-        def remove_from_triangle(self, triangle):
-            try:
-                self._triangles.pop(self._triangles.index(triangle))
-            except ValueError:
-                raise ValueError
-
-        @property
-        def triangles(self):
-            return self._triangles
-
-        @property
-        def normal(self):
-            return self._normal
-
-        @normal.setter
-        def normal(self, value):
-            self._normal = value
-
-        @property
-        def point(self):
-            return self._point
-
-        @property
-        def color(self):
-            return self._color
-
-        @property
-        def tex_coord(self):
-            return self._tex_coord
+    _Vertex = namedtuple('_Vertex', 'point color tex_coord normal')
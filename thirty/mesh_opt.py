@@ -0,0 +1,159 @@
+"""
+Post processing of index buffers for better GPU vertex cache utilization.
+"""
+
+__copyright__ = """
+MIT License
+
+Copyright (c) 2019 tcdude
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import heapq
+
+import numpy as np
+
+_CACHE_SIZE = 32
+_CACHE_DECAY_POWER = 1.5
+_LAST_TRI_SCORE = 0.75
+_VALENCE_BOOST_SCALE = 2.0
+_VALENCE_BOOST_POWER = 0.5
+
+
+def _vertex_score(cache_pos, remaining, cache_size):
+    """
+    Return the Forsyth score of a vertex.
+
+    Args:
+        cache_pos: position in the simulated cache or -1 if not cached
+        remaining: number of not yet emitted triangles using the vertex
+        cache_size: size of the simulated cache
+    """
+    if not remaining:
+        return -1.0
+    score = 0.0
+    if cache_pos >= 0:
+        if cache_pos < 3:
+            # vertices of the last triangle are deliberately not favoured,
+            # to avoid long thin strips
+            score = _LAST_TRI_SCORE
+        else:
+            score = (
+                1.0 - (cache_pos - 3) / (cache_size - 3)
+            ) ** _CACHE_DECAY_POWER
+    return score + _VALENCE_BOOST_SCALE * remaining ** -_VALENCE_BOOST_POWER
+
+
+def optimize_vertex_cache(indices, cache_size=_CACHE_SIZE):
+    """
+    Return the triangles of `indices` as ndarray of shape (M, 3), reordered
+    with Tom Forsyth's linear-speed vertex cache optimisation, so that
+    triangles sharing vertices are emitted close to each other. Winding and
+    vertex ids are kept as they are.
+
+    Args:
+        indices: array like of vertex ids, three per triangle
+        cache_size: size of the simulated post-transform cache (> 3)
+    """
+    tris = np.asarray(indices).reshape(-1, 3)
+    if len(tris) < 3:
+        return tris.copy()
+    flat = tris.ravel()
+    num_vertices = int(flat.max()) + 1
+    valence = np.bincount(flat, minlength=num_vertices)
+    bounds = np.concatenate(([0], np.cumsum(valence))).tolist()
+    by_vertex = (np.argsort(flat, kind='stable') // 3).tolist()
+    vertex_tris = [
+        by_vertex[bounds[v]:bounds[v + 1]] for v in range(num_vertices)
+    ]
+    remaining = valence.tolist()
+    tri_list = tris.tolist()
+
+    cache_pos = [-1] * num_vertices
+    scores = [_vertex_score(-1, r, cache_size) for r in remaining]
+    tri_scores = [scores[a] + scores[b] + scores[c] for a, b, c in tri_list]
+    emitted = [False] * len(tri_list)
+    # (-score, triangle) with at least one entry per triangle, that is not
+    # below its current score. Lower scores are pushed lazily on pop.
+    heap = [(-score, t) for t, score in enumerate(tri_scores)]
+    heapq.heapify(heap)
+    order = []
+    cache = []
+    best = heap[0][1]
+    while True:
+        order.append(best)
+        emitted[best] = True
+        tri = tri_list[best]
+        for v in tri:
+            remaining[v] -= 1
+            vertex_tris[v].remove(best)
+        cache = tri + [v for v in cache if v not in tri]
+        evicted = cache[cache_size:]
+        cache = cache[:cache_size]
+        for v in evicted:
+            cache_pos[v] = -1
+        touched = set()
+        for pos, v in enumerate(cache + evicted):
+            if v in cache:
+                cache_pos[v] = pos
+            scores[v] = _vertex_score(cache_pos[v], remaining[v], cache_size)
+            touched.update(vertex_tris[v])
+
+        best, best_score = -1, -1.0
+        for t in touched:
+            a, b, c = tri_list[t]
+            score = scores[a] + scores[b] + scores[c]
+            if score > tri_scores[t]:
+                heapq.heappush(heap, (-score, t))
+            tri_scores[t] = score
+            if score > best_score:
+                best, best_score = t, score
+        if best < 0:
+            if len(order) == len(tri_list):
+                break
+            # nothing left that touches the cache, start a new island with
+            # the best scored triangle, skipping stale heap entries
+            while True:
+                score, best = heapq.heappop(heap)
+                if emitted[best]:
+                    continue
+                if -score == tri_scores[best]:
+                    break
+                heapq.heappush(heap, (-tri_scores[best], best))
+    return tris[order]
+
+
+def optimize_vertex_fetch(indices, num_vertices):
+    """
+    Return 2-Tuple of the old vertex ids in their new order (K, ) and the
+    triangles of `indices` remapped to it (M, 3). Vertices are ordered by
+    their first use in `indices`, so that vertex fetch walks the buffer
+    mostly linearly. Vertices that are never used are dropped.
+
+    Args:
+        indices: array like of vertex ids, three per triangle
+        num_vertices: number of vertices `indices` refers to
+    """
+    flat = np.asarray(indices).reshape(-1)
+    used, first = np.unique(flat, return_index=True)
+    order = used[np.argsort(first)]
+    remap = np.full(num_vertices, -1, flat.dtype)
+    remap[order] = np.arange(len(order))
+    return order, remap[flat].reshape(-1, 3)
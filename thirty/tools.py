@@ -26,20 +26,65 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from panda3d.core import Vec3
+from functools import lru_cache
 
+import numpy as np
 
-def tri_face_norm(p1, p2, p3, normalized=True):
-    u = p2 - p1
-    v = p3 - p1
-    n = Vec3(
-        u.y * v.z - u.z * v.y,
-        u.z * v.x - u.x * v.z,
-        u.x * v.y - u.y * v.x
+
+def look_at(direction):
+    """
+    Return the rotation of a node at the origin after
+    ``NodePath.look_at(direction)`` as ndarray of shape (3, 3), with the rows
+    right, forward and up. Looking straight up or down keeps heading 0 and a
+    zero direction keeps looking along +Y, like Panda3D does. Accepts an
+    array of directions of shape (N, 3) as well and returns (N, 3, 3) in that
+    case.
+
+    Args:
+        direction: Vec3 or array like of shape (3, ) or (N, 3)
+    """
+    forward = np.array(direction, dtype=np.float64)[..., :3]
+    length = np.linalg.norm(forward, axis=-1, keepdims=True)
+    # A zero direction keeps the default orientation, i.e. looking along +Y
+    forward = np.where(
+        length > 0,
+        forward / np.where(length > 0, length, 1.0),
+        (0.0, 1.0, 0.0)
     )
+    right = np.cross(forward, (0, 0, 1))
+    length = np.linalg.norm(right, axis=-1, keepdims=True)
+    degenerate = length < 1e-12
+    right = np.where(
+        degenerate,
+        (1.0, 0.0, 0.0),
+        right / np.where(degenerate, 1.0, length)
+    )
+    return np.stack((right, forward, np.cross(right, forward)), axis=-2)
+
+
+def tri_face_norm(p1, p2, p3, normalized=True):
+    n = (p2 - p1).cross(p3 - p1)
     return n.normalized() if normalized else n
 
 
+def tri_face_norms(p1, p2, p3, normalized=True):
+    """
+    Return the face normals of many triangles at once as ndarray of shape
+    (N, 3). Vectorized version of tri_face_norm(...).
+
+    Args:
+        p1: array like of shape (N, 3) with the first points
+        p2: array like of shape (N, 3) with the second points
+        p3: array like of shape (N, 3) with the third points
+        normalized: whether to return unit length normals
+    """
+    n = np.cross(np.subtract(p2, p1), np.subtract(p3, p1))
+    if normalized:
+        length = np.linalg.norm(n, axis=-1, keepdims=True)
+        n = np.divide(n, length, out=np.zeros_like(n), where=length > 0)
+    return n
+
+
 def _connect_lines(upper, lower, wrap_around, ccw):
     """
     Internal execution of connect_lines(...).
@@ -86,12 +131,27 @@ def _connect_lines(upper, lower, wrap_around, ccw):
     return indices
 
 
-_connect_lines_cache = {}
+@lru_cache(maxsize=256)
+def connect_lines(upper, lower, wrap_around=True, ccw=True):
+    """
+    Return triangle indices to connect two lines of vertices. Results are
+    memoized and returned as immutable tuples.
+
+    Args:
+        upper: Number of vertices in the upper "line"
+        lower: Number of vertices in the lower "line"
+        wrap_around: (Optional) whether to connect the ends
+        ccw: whether lines are in counter clock wise order
+    """
+    return tuple(_connect_lines(upper, lower, wrap_around, ccw))
 
 
-def connect_lines(upper, lower, wrap_around=True, ccw=True):
+@lru_cache(maxsize=256)
+def connect_lines_array(upper, lower, wrap_around=True, ccw=True):
     """
-    Return triangle indices to connect two lines of vertices.
+    Return the triangles of connect_lines(...) as a read only int array of
+    shape (M, 3), indexing into the concatenation of the upper and lower line.
+    Built directly with numpy, without going through the tuple form.
 
     Args:
         upper: Number of vertices in the upper "line"
@@ -99,7 +159,25 @@ def connect_lines(upper, lower, wrap_around=True, ccw=True):
         wrap_around: (Optional) whether to connect the ends
         ccw: whether lines are in counter clock wise order
     """
-    k = (upper, lower, wrap_around, ccw)
-    if k not in _connect_lines_cache:
-        _connect_lines_cache[k] = _connect_lines(*k)
-    return _connect_lines_cache[k]
+    if not (1 < upper == lower or [upper, lower].count(1) == 1):
+        raise ValueError('Wrong input. upper and lower either need to be '
+                         'the same and > 1 or any combination of 1 and >=2')
+
+    size = max(upper, lower)
+    i = np.arange(size if wrap_around else size - 1, dtype=np.int32)
+    j = (i + 1) % size
+    if upper == 1:
+        a, b = (1 + i, 1 + j) if ccw else (1 + j, 1 + i)
+        table = np.stack((np.zeros_like(i), a, b), axis=1)
+    elif lower == 1:
+        a, b = (j, i) if ccw else (i, j)
+        table = np.stack((a, b, np.full_like(i, upper)), axis=1)
+    else:
+        if ccw:
+            pair = (i, upper + i, upper + j), (j, i, upper + j)
+        else:
+            pair = (i, upper + j, upper + i), (i, j, upper + j)
+        table = np.stack([np.stack(t, axis=1) for t in pair], axis=1)
+        table = table.reshape(-1, 3)
+    table.flags.writeable = False
+    return table